@@ -1,18 +1,25 @@
 
 ##############################################
 import os
+import csv
 import random
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
 import pandas as pd
 from tqdm import tqdm
 from bs4 import BeautifulSoup, Tag
 from typing import Tuple
+from urllib.parse import urljoin
 import requests
+import ahocorasick
 
 
 ############## helper functions file manipulation##############
 
 def get_data_from_db(file_path: str) -> pd.Series:
-    """retrieves a panda Series of names from a csv file containing notable persons
+    """retrieves a panda Series of names from a csv file containing notable persons.
+       The names are lowercased, split into single spaced words and deduplicated once when loading
 
     Args:
         file_path (str): location of the csv file
@@ -23,16 +30,17 @@ def get_data_from_db(file_path: str) -> pd.Series:
     if not os.path.exists(file_path):
         return []
     df = pd.read_csv(file_path, encoding='utf-8')
-    df.dropna()
-    return df.iloc[:, 0]
+    names = df.iloc[:, 0].dropna().astype(str).str.lower().str.split().str.join(" ")
+    return names[names != ""].drop_duplicates()
 
-def overwrite_file(filename:str, new_contents: list[str] | pd.DataFrame, file_type="csv") -> None:
-    """overwrites an existing file by adding new contents to the file and removing duplicates.
-       if the file does not exist, a new file is created instead in which the new contents are written in
+def append_to_file(filename:str, new_contents: list[str] | pd.DataFrame, seen_rows: set[int], file_type="csv") -> None:
+    """appends the new contents to a file without rereading it. Rows that have already been written during this run are skipped.
+       if the file does not exist or is empty, the header is written first
 
     Args:
-        filename (str): The name of the file to overwrite
+        filename (str): The name of the file to append to
         new_contents (list[str] | pd.DataFrame): The data that will be added to the file. The type depends on the file type 
+        seen_rows (set[int]): The hashes of the rows already written to the file, updated with the newly written rows
         file_type (str, optional): The type of the file. Defaults to "csv".
 
     Raises:
@@ -42,30 +50,54 @@ def overwrite_file(filename:str, new_contents: list[str] | pd.DataFrame, file_ty
     if file_type == "csv":
         if not isinstance(new_contents, pd.DataFrame):
             raise Exception("Use a panda dataframe for writing into a csv file")
-        file_path = filename
-        old_contents = pd.read_csv(file_path)
-        if old_contents is None:
-            new_contents.to_csv(file_path, index=False)
-        else:
-            merged_contents = concat_and_filter_unique_values(old_contents, new_contents)
-            merged_contents.to_csv(file_path, index=False)
+        write_header = not os.path.exists(filename) or os.path.getsize(filename) == 0
+        new_rows = []
+        for row in new_contents.fillna("").itertuples(index=False, name=None):
+            # only the 64 bit hash of a row is kept, the row itself can be freed once it is written
+            row_hash = hash(row)
+            if row_hash not in seen_rows:
+                seen_rows.add(row_hash)
+                new_rows.append(row)
+        with open(filename, "a", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file, lineterminator="\n")
+            if write_header:
+                writer.writerow(new_contents.columns)
+            writer.writerows(new_rows)
     else: 
         raise Exception("invalid file_type, only csvs are accepted")
 
-############## helper functions for extraction and structuring##############
-def concat_and_filter_unique_values(df1: pd.DataFrame, df2: pd.DataFrame) -> pd.DataFrame:
-    """concatenates two dataframes and removes all multiple appearances of duplicate values
+def flush_output_buffers(output_buffers: dict[str, list[pd.DataFrame]], seen_rows: dict[str, set[int]], writer: ThreadPoolExecutor) -> list[Future]:
+    """hands the buffered page results over to the writer thread, which appends them to their files while the crawl continues
 
     Args:
-        df1 (pd.DataFrame): The first dataframe
-        df2 (pd.DataFrame): The second dataframe
+        output_buffers (dict[str, list[pd.DataFrame]]): page results collected since the last flush, keyed by the file they belong to. The buffers are emptied
+        seen_rows (dict[str, set[int]]): hashes of the rows already written, keyed by file. Only the writer thread updates them
+        writer (ThreadPoolExecutor): executor with a single worker, so that the files are written in order
 
     Returns:
-        pd.DataFrame: The concatenation of both dataframes with only unique values 
+        list[Future]: the submitted writes, which are done once the results are in the files
+    """
+    writes = []
+    for filename, buffered_contents in output_buffers.items():
+        if buffered_contents:
+            new_contents = pd.concat(buffered_contents, ignore_index=True)
+            writes.append(writer.submit(append_to_file, filename, new_contents, seen_rows[filename]))
+            output_buffers[filename] = []
+    return writes
+
+def remove_duplicates_from_file(filename: str) -> None:
+    """removes all duplicate rows of a csv file, e.g. rows appended by append_to_file in previous runs
+
+    Args:
+        filename (str): The name of the csv file
     """
-    combined_df = pd.concat([df1, df2])
-    return combined_df.drop_duplicates(subset=df1.columns)
+    # a crawl without any results never creates the file
+    if not os.path.exists(filename):
+        return
+    contents = pd.read_csv(filename)
+    contents.drop_duplicates().to_csv(filename, index=False)
 
+############## helper functions for extraction and structuring##############
 def merge_csvs(file1, file2):
 
     df1 = pd.read_csv(file1)
@@ -81,36 +113,44 @@ def merge_csvs(file1, file2):
     merged_df.to_csv('merged_file.csv', index=False)
 
 def find_paragraphs_for_concepts(soup: Tag, concepts: pd.DataFrame)-> pd.DataFrame:
-    """Finds the paragraph the concepts appear in and writes it in an additional "information" column
+    """Finds the paragraphs the concepts appear in and writes them in an additional "information" column.
+       Every paragraph text is only stored once per page and shared between all concepts appearing in it
 
     Args:
         soup (Tag): beautiful soup tag
         concepts (pd.DataFrame): concepts to find the paragraphs for
 
     Returns:
-        pd.DataFrame: the original concepts with an additional column information
+        pd.DataFrame: the original concepts with an additional column information holding a tuple of paragraphs per concept
     """
-    all_paragraphs = soup.select("p")
+    # identical paragraphs, e.g. empty ones, are only kept once
+    paragraph_texts = list(dict.fromkeys(para.get_text().lower() for para in soup.select("p")))
     new_concepts = concepts.copy()
-    new_concepts["information"] =""
-    for idx, concept in new_concepts.iterrows():
-        for para in all_paragraphs:
-            para_text = para.get_text().lower()
-            if concept["concepts"] in para_text:
-                if concept["information"] == "":
-                    new_concepts.at[idx, "information"] = para_text
-                else:
-                    new_concepts.at[idx, "information"] += ", " + para_text
+
+    # scan every paragraph once for all concepts instead of once per concept
+    automaton = ahocorasick.Automaton()
+    for concept in new_concepts["concepts"]:
+        if isinstance(concept, str) and concept:
+            automaton.add_word(concept, concept)
+    automaton.make_automaton()
+
+    information = defaultdict(list)
+    if automaton.kind == ahocorasick.AHOCORASICK:
+        for para_text in paragraph_texts:
+            for concept in {concept for _, concept in automaton.iter(para_text)}:
+                information[concept].append(para_text)
+
+    new_concepts["information"] = [tuple(information.get(concept, ())) for concept in new_concepts["concepts"]]
     return new_concepts
 
-def get_all_italic_words(soup_content: Tag) -> pd.DataFrame:
+def get_all_italic_words(soup_content: Tag) -> set[str]:
     """The bodycontent of the wikipedia Page to retrieve the data from
 
     Args:
         soup_content (Tag): The bodycontent of the wikipedia Page to retrieve the data from
 
     Returns:
-        pd.DataFrame: a dataframe containing all words written in italic with the head: "concepts"
+        set[str]: all lowercased words written in italic
     """
     italic_words = set()
     italic_tags = soup_content.find_all("i")
@@ -118,28 +158,72 @@ def get_all_italic_words(soup_content: Tag) -> pd.DataFrame:
         italic_phrase = tag.text.strip()
         if italic_phrase.isalpha() and len(italic_phrase) > 1:
             italic_words.add(italic_phrase.lower())
-    return pd.DataFrame({"concepts": list(italic_words)})
+    return italic_words
 
-def contains_person_name(caption: str):
-    if isinstance(caption, float):
+def pad_words(text: str) -> str:
+    """normalizes the whitespace of a text and pads it with spaces, so that whole words can be matched as " word "
+
+    Args:
+        text (str): the text to pad
+
+    Returns:
+        str: the lowercased text with single spaces between words and a space at the beginning and end
+    """
+    return " " + " ".join(text.lower().split()) + " "
+
+def build_automaton(names: pd.Series | list[str]) -> ahocorasick.Automaton:
+    """builds an Aho-Corasick automaton over the padded names of a database, so that all names occuring in a caption 
+       are found in a single scan of the caption instead of one scan per name
+
+    Args:
+        names (pd.Series | list[str]): names of notable persons or locations
+
+    Returns:
+        ahocorasick.Automaton: automaton matching the padded names
+    """
+    automaton = ahocorasick.Automaton()
+    for name in names:
+        if isinstance(name, str) and name.strip():
+            automaton.add_word(pad_words(name), name)
+    automaton.make_automaton()
+    return automaton
+
+def contains_name_from_automaton(caption: str, automaton: ahocorasick.Automaton) -> bool:
+    """checks whether any name of the automaton appears as whole words in the caption
+
+    Args:
+        caption (str): the caption to search in
+        automaton (ahocorasick.Automaton): automaton built with build_automaton
+
+    Returns:
+        bool: True if at least one name appears in the caption
+    """
+    if not isinstance(caption, str) or automaton.kind != ahocorasick.AHOCORASICK:
         return False
-    caption_words = caption.split()
-    for name in PERSON_DB:
-        name_words = name.split()
-        if all(word in caption_words for word in name_words):
-            return True
-    return False
+    return next(automaton.iter(pad_words(caption)), None) is not None
+
+def contains_names_in_column(column: pd.Series, automaton: ahocorasick.Automaton) -> pd.Series:
+    """checks for every entry of a column whether any name of the automaton appears as whole words in it.
+       The entries are lowercased and padded column-wise, so only the automaton scan runs per entry
+
+    Args:
+        column (pd.Series): column of captions or concepts to search in
+        automaton (ahocorasick.Automaton): automaton built with build_automaton
+
+    Returns:
+        pd.Series: boolean mask that is True where at least one name appears
+    """
+    if automaton.kind != ahocorasick.AHOCORASICK:
+        return pd.Series(False, index=column.index)
+    padded_column = " " + column.str.lower().str.split().str.join(" ") + " "
+    # missing entries stay missing when padded and never contain a name
+    return padded_column.map(lambda text: isinstance(text, str) and next(automaton.iter(text), None) is not None).astype(bool)
+
+def contains_person_name(caption: str):
+    return contains_name_from_automaton(caption, PERSON_AUTOMATON)
 
 def contains_location(caption: str):
-    if isinstance(caption, float):
-        return False
-    caption_words = caption.split()
-    for location in LOCATION_DB:
-        if isinstance(location, str):
-            location_words = location.split()
-            if all(word in caption_words for word in location_words):
-                return True
-    return False
+    return contains_name_from_automaton(caption, LOCATION_AUTOMATON)
 
 def get_captioned_images(soup_content: Tag) -> pd.DataFrame:
     """Returns all image source urls of the wikipedia page along their captions or image titles
@@ -152,34 +236,41 @@ def get_captioned_images(soup_content: Tag) -> pd.DataFrame:
     """
     img_captions = []
     img_sources = []
+    # set of the collected sources for constant time lookups when going through the remaining images
+    seen_sources = set()
  
     for fig in soup_content.find_all("figure"):
         img = fig.find("img")
 
         if img:
-            img_caption = fig.find("figcaption").get_text().strip().lower()
             img_src = img.get("src")
-            if any(char.isdigit() for char in img_caption) or not contains_person_name(img_caption):
-                if img_src.endswith(("jpg", "jpeg", "gif")):
+            figcaption = fig.find("figcaption")
+            # check the cheap extension first, extract the caption only once per figure
+            if img_src and figcaption and img_src.endswith(IMAGE_EXTENSIONS):
+                img_caption = figcaption.get_text().strip().lower()
+                if any(char.isdigit() for char in img_caption) or not contains_person_name(img_caption):
                     img_captions.append(img_caption)
-                    img_sources.append(img.get("src")) 
+                    img_sources.append(img_src)
+                    seen_sources.add(img_src)
 
     for img in soup_content.find_all("img"):
         img_src = img.get("src") 
         img_title = img.get("alt")
 
-        if (img_src not in img_sources and
-            img_src.endswith(("jpg", "jpeg", "gif")) and
+        if (img_src and
+            img_src not in seen_sources and
+            img_src.endswith(IMAGE_EXTENSIONS) and
             img_title and
             img_title != ""):
                 img_title = img_title.strip().lower()
                 if any(char.isdigit() for char in img_title) or not contains_person_name(img_title):
                     img_captions.append(img_title)
                     img_sources.append(img_src)
+                    seen_sources.add(img_src)
 
     return pd.DataFrame({'img_source': img_sources,'img_captions': img_captions})
 
-def extract_link_concepts_and_urls(soup_content: Tag, current_url: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+def extract_link_concepts_and_urls(soup_content: Tag, current_url: str) -> Tuple[set[str], set[str]]:
     """Returns all extracted urls leading to other wikipedia pages of the wikipedia page and
        concepts extracted from the urls.
 
@@ -187,7 +278,7 @@ def extract_link_concepts_and_urls(soup_content: Tag, current_url: str) -> Tuple
         soup_content (Tag): The bodycontent of the wikipedia Page to retrieve the data from
 
     Returns:
-        Tuple[pd.DataFrame, pd.DataFrame]: Urls and url concepts of the webpage with the columns "url" and "concepts" 
+        Tuple[set[str], set[str]]: absolute urls and url concepts of the webpage
     """
     url_concepts = set()
     scraped_urls = set()
@@ -197,20 +288,24 @@ def extract_link_concepts_and_urls(soup_content: Tag, current_url: str) -> Tuple
     if language_code in language_prefixes:
         id = language_prefixes[language_code]
     else:
-        return pd.DataFrame({"urls":[]}), pd.DataFrame({"concepts": []})
+        return set(), set()
     
     reference_section = soup_content.find(id=id)
+    # the first link of the reference section marks the end of the article links, look it up only once
+    reference_link = reference_section.find_next("a") if reference_section else None
+    stop_href = reference_link.get("href") if reference_link else None
     outgoing_links = soup_content.find_all("a")
     for link in outgoing_links:
         concept_title = link.get("title")
         href = link.get("href")
-        if reference_section and href == reference_section.find_next("a").get("href"):
+        if stop_href is not None and href == stop_href:
             break
         if href and href.startswith("/wiki/") and ':' not in href and "(identifier)" not in href:
-            if concept_title.isalpha() and len(concept_title) > 1:
+            if concept_title and concept_title.isalpha() and len(concept_title) > 1:
                 url_concepts.add(concept_title.lower())
-            scraped_urls.add(href)
-    return pd.DataFrame({"urls":list(scraped_urls)}), pd.DataFrame({"concepts": list(url_concepts)})
+            # the urls are stored in the same absolute form as the visited urls so both can be compared
+            scraped_urls.add(urljoin(BASE_URL, href))
+    return scraped_urls, url_concepts
 
 def get_default_culture_and_semantic_field(title: str) -> Tuple[str, str]:
     """returns culture and semantic field for preassignment by using keywords based on the title
@@ -221,16 +316,25 @@ def get_default_culture_and_semantic_field(title: str) -> Tuple[str, str]:
     Returns:
         Tuple[str, str]: preassigned culture and semantic field of the title
     """
+    return find_culture_and_semantic_field(title)
+
+def find_culture_and_semantic_field(text: str) -> Tuple[str, str]:
+    """finds the first culture and the first semantic field keyword of a text in a single scan
+
+    Args:
+        text (str): the text to search for keywords, e.g. a title or the information of a concept
+
+    Returns:
+        Tuple[str, str]: culture and semantic field of the first keywords found, empty strings if there are none
+    """
     culture = ""
     semantic_field = ""
-    for keyword in CULTURES.keys():
-        if keyword in title:
-            culture = CULTURES[keyword]
-            break
-
-    for keyword in SEMANTIC_FIELDS.keys():
-        if keyword in title:
-            semantic_field = SEMANTIC_FIELDS[keyword]
+    for _, (kind, value) in KEYWORD_AUTOMATON.iter(text):
+        if kind == "culture" and not culture:
+            culture = value
+        elif kind == "semantic_field" and not semantic_field:
+            semantic_field = value
+        if culture and semantic_field:
             break
 
     return culture, semantic_field
@@ -247,17 +351,29 @@ def assign_culture_and_semantic_fields_to_concepts(concepts: pd.DataFrame) -> pd
     Returns:
         pd.DataFrame: Dataframe with the concepts and an added column "culture" that assigns each concept a culture
     """
-    for idx, concept in concepts.iterrows():
-        for keyword in CULTURES.keys():
-            if keyword in concept["information"]:
-                concepts.at[idx, "culture"] = CULTURES[keyword]
-                break
-            
-    for idx, concept in concepts.iterrows():
-        for keyword in SEMANTIC_FIELDS.keys():
-            if keyword in concept["information"]:
-                concepts.at[idx, "semantic_field"] = SEMANTIC_FIELDS[keyword]
+    # paragraphs are shared between concepts, so every paragraph is only scanned for keywords once
+    paragraph_keywords = {}
+    concept_cultures = []
+    concept_semantic_fields = []
+    for paragraphs in concepts["information"]:
+        culture = ""
+        semantic_field = ""
+        for paragraph in paragraphs:
+            if paragraph not in paragraph_keywords:
+                paragraph_keywords[paragraph] = find_culture_and_semantic_field(paragraph)
+            paragraph_culture, paragraph_semantic_field = paragraph_keywords[paragraph]
+            culture = culture or paragraph_culture
+            semantic_field = semantic_field or paragraph_semantic_field
+            if culture and semantic_field:
                 break
+        concept_cultures.append(culture)
+        concept_semantic_fields.append(semantic_field)
+
+    # the first keyword found in the information overwrites the preassigned culture and semantic field
+    cultures = pd.Series(concept_cultures, index=concepts.index, dtype=object)
+    semantic_fields = pd.Series(concept_semantic_fields, index=concepts.index, dtype=object)
+    concepts["culture"] = cultures.mask(cultures == "", concepts["culture"])
+    concepts["semantic_field"] = semantic_fields.mask(semantic_fields == "", concepts["semantic_field"])
 
     return concepts.drop('information', axis=1)
 
@@ -272,19 +388,19 @@ def remove_people_and_locations_from_concepts(concepts: pd.DataFrame) -> pd.Data
         pd.DataFrame: filtered concepts without notable persons and locations
     """
     
-    # condition = concepts['concepts'].apply(lambda concept: not contains_person_name(concept) and not contains_location(concept))
-    condition = concepts['concepts'].apply(lambda concept: not contains_location(concept))
+    # condition = ~contains_names_in_column(concepts['concepts'], PERSON_AUTOMATON) & ~contains_names_in_column(concepts['concepts'], LOCATION_AUTOMATON)
+    condition = ~contains_names_in_column(concepts['concepts'], LOCATION_AUTOMATON)
     filtered_df = concepts[condition]
 
     return filtered_df
 
-def append_multilingual_url(default_culture: str, next_urls: list[str], visited_urls: list[str]) -> None:
+def append_multilingual_url(default_culture: str, next_urls: deque[str], visited_urls: set[str]) -> None:
     """appends the multilingual version of a web page if it exists based on its langauge code
 
     Args:
         default_culture (str): preassigned culture of the web page
-        next_urls (list[str]): list of the next urls to visit
-        visited_urls (list[str]): list of the already visited urls
+        next_urls (deque[str]): queue of the next urls to visit
+        visited_urls (set[str]): set of the already visited urls
     """
     language_prefixes = {"korean": "ko", "chinese":"zh", "spanish":"es", "german":"de"}
     lang_dict = {}
@@ -296,28 +412,61 @@ def append_multilingual_url(default_culture: str, next_urls: list[str], visited_
         if  new_link not in visited_urls:
             next_urls.append(new_link)
 
-def select_next_urls_to_jump_to():
-    """selects the next urls to visit
+def fetch_page(url: str) -> bytes | None:
+    """downloads a web page. The body is only read for successful html responses, other responses are closed right away
+
+    Args:
+        url (str): url of the web page
 
     Returns:
-        next_urls list[string]: list of the urls to visit next 
+        bytes | None: content of the web page or None if the page could not be downloaded or is not an html page
     """
-    url_df = pd.read_csv_file(ALL_URLS_FILE)
-    # select 100 urls to append and only append urls not visited yet
-    new_urls = url_df["urls"].iloc[:100]
-    
-    if visited_urls:
-        next_urls = ["https://en.wikipedia.org/" + str(url) for url in new_urls if "https://en.wikipedia.org/" + str(url) not in visited_urls]
-    else: 
-        next_urls = ["https://en.wikipedia.org/" + str(url) if not url.startswith("https://") else str(url) for url in new_urls ]
-    # remove the 100 urls from the queue
-    url_df["urls"].iloc[100:].to_csv(ALL_URLS_FILE, index=False)
+    try:
+        with requests.get(url=url, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            if response.status_code != 200 or "text/html" not in response.headers.get("Content-Type", ""):
+                return None
+            return response.content
+    except requests.RequestException:
+        return None
+
+def prefetch_pages(next_urls: deque[str], pending_responses: dict[str, Future], executor: ThreadPoolExecutor) -> None:
+    """starts downloading the next web pages in the background, so that the network requests overlap with parsing the current page
+
+    Args:
+        next_urls (deque[str]): queue of the next urls to visit
+        pending_responses (dict[str, Future]): downloads that have already been started, keyed by their url
+        executor (ThreadPoolExecutor): the thread pool executing the downloads
+    """
+    for url in islice(next_urls, PREFETCH_SIZE):
+        if url not in pending_responses:
+            pending_responses[url] = executor.submit(fetch_page, url)
+
+def select_next_urls_to_jump_to(url_queue: deque[str], visited_urls: set[str]) -> deque[str]:
+    """selects the next urls to visit by taking up to JUMP_SIZE urls from the front of the url queue, skipping urls already visited
+
+    Args:
+        url_queue (deque[str]): queue of all collected outgoing urls, the selected urls are removed from it
+        visited_urls (set[str]): set of the already visited urls
+
+    Returns:
+        next_urls deque[string]: queue of the urls to visit next 
+    """
+    next_urls = deque()
+    while url_queue and len(next_urls) < JUMP_SIZE:
+        url = url_queue.popleft()
+        if url not in visited_urls:
+            next_urls.append(url)
     return next_urls
 
 
 LOCATION_DB = get_data_from_db("data/GeoNames_DB.csv")
 PERSON_DB = get_data_from_db("data/name_db.csv")
+LOCATION_AUTOMATON = build_automaton(LOCATION_DB)
+PERSON_AUTOMATON = build_automaton(PERSON_DB)
 START_URLS_FILE = "data/start_urls.csv"
+# the relative links of the web pages are resolved against the english wikipedia
+BASE_URL = "https://en.wikipedia.org/"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".gif")
 
 
 CULTURES = {"german":"german", "germany":"german", "spanish":"spanish", "spain":"spanish", "chinese":"chinese", "china": "chinese", "korean": "korean", "korea": "korean",
@@ -336,57 +485,102 @@ SEMANTIC_FIELDS = {"beverage":"beverages", "alcohol": "beverages", "beer": "beve
                     "饮料":"beverages", "庆祝":"celebration", "食物": "food", "衣服": "clothing", "水果":"fruit", "房子": "houses", "乐器":"music", "宗教": "religion", "运动": "sport","器具": "utensil", "工具": "utensil", "蔬菜":"vegetable", "视觉艺术": "visual arts",
                     "음료": "beverages", "축하 ": "celebration", "축하 ": "food", "옷": "clothing", "과일": "fruit", "집": "houses", "악기": "music", "종교": "religion", "스포츠": "sport", "도구": "utensil", "도구": "utensil", "채소": "vegetable", "시각 예술": "visual arts"
                     }
+# automaton over the keywords of both dictionaries, so that a text is scanned once for its culture and semantic field
+KEYWORD_AUTOMATON = ahocorasick.Automaton()
+for keyword, culture in CULTURES.items():
+    KEYWORD_AUTOMATON.add_word(keyword, ("culture", culture))
+for keyword, semantic_field in SEMANTIC_FIELDS.items():
+    KEYWORD_AUTOMATON.add_word(keyword, ("semantic_field", semantic_field))
+KEYWORD_AUTOMATON.make_automaton()
+
 VISITED_URLS_FILE = "output/visited_urls.csv"
 ALL_URLS_FILE = "output/all_urls.csv"
 CONCEPT_FILE = "output/concept_candidates.csv"
 IMAGES_FILE = "output/images.csv"
 
 ITERATIONS = 15000
+# number of web pages that are downloaded concurrently ahead of the current page
+PREFETCH_SIZE = 32
+# seconds to wait for a web page to respond
+REQUEST_TIMEOUT = 10
+# number of web pages whose results are collected in memory before being written
+FLUSH_INTERVAL = 100
+# number of urls taken from the url queue once there are no urls left to visit
+JUMP_SIZE = 100
 
 df_next_urls_ = pd.read_csv(START_URLS_FILE)
 next_urls = df_next_urls_["urls"].head(200).tolist()
 random.shuffle(next_urls)
-empty_df = pd.DataFrame(columns=df_next_urls_.columns)
-empty_df.to_csv(ALL_URLS_FILE, index=False)
-visited_urls =[]
-
-for i in tqdm(range(ITERATIONS)):
-    response = requests.get(url=next_urls[0])
-    visited_urls.append(next_urls[0])
-
-    if response:
-        soup = BeautifulSoup(response.content, 'html.parser')
-        soup_content = soup.find(id="bodyContent")
-
-        title = soup.select("#firstHeading")[0].text.lower()
-        default_culture, default_semantic_field = get_default_culture_and_semantic_field(title)
-        append_multilingual_url(default_culture, next_urls, visited_urls)
-
-        # extract images from the web page
-        page_images = get_captioned_images(soup_content)
-        page_images["culture"] = default_culture
-        page_images["semantic_field"] = default_semantic_field
-        overwrite_file(IMAGES_FILE, page_images)
+next_urls = deque(next_urls)
+# the outgoing urls are kept in memory and only written to ALL_URLS_FILE at the end of the crawl
+url_queue = deque()
+queued_urls = set()
+visited_urls = set()
+seen_rows = {IMAGES_FILE: set(), CONCEPT_FILE: set()}
+output_buffers = {IMAGES_FILE: [], CONCEPT_FILE: []}
+executor = ThreadPoolExecutor(max_workers=PREFETCH_SIZE)
+writer = ThreadPoolExecutor(max_workers=1)
+pending_responses = {}
+pending_writes = []
+
+# the buffered results and the url queue are also written if the crawl stops with an error
+try:
+    for i in tqdm(range(ITERATIONS)):
+        prefetch_pages(next_urls, pending_responses, executor)
+        page_content = pending_responses.pop(next_urls[0]).result()
+        visited_urls.add(next_urls[0])
+
+        if page_content:
+            soup = BeautifulSoup(page_content, 'lxml')
+            soup_content = soup.find(id="bodyContent")
+
+            title = soup.select("#firstHeading")[0].text.lower()
+            default_culture, default_semantic_field = get_default_culture_and_semantic_field(title)
+            append_multilingual_url(default_culture, next_urls, visited_urls)
+
+            # extract images from the web page
+            page_images = get_captioned_images(soup_content)
+            page_images["culture"] = default_culture
+            page_images["semantic_field"] = default_semantic_field
+            output_buffers[IMAGES_FILE].append(page_images)
         
-        # extract urls and add the urls that have not been visited yet
-        outgoing_links, url_concepts = extract_link_concepts_and_urls(soup_content, next_urls[0])
-        page_outgoing_urls = outgoing_links[~outgoing_links["urls"].isin(visited_urls)]
-        overwrite_file(ALL_URLS_FILE, page_outgoing_urls)
-        
-
-        # extract concepts from links and italic words
-        concepts = concat_and_filter_unique_values(url_concepts, get_all_italic_words(soup_content))
-        concepts["culture"] = default_culture
-        concepts["semantic_field"] = default_semantic_field
-        concepts_with_information = find_paragraphs_for_concepts(soup, concepts)
-        concepts_culture = assign_culture_and_semantic_fields_to_concepts(concepts_with_information)
-
-        overwrite_file(CONCEPT_FILE, concepts_culture)
-
-    next_urls = next_urls[1:]
-    # parse new urls if there are no urls to jumps to
-    if not next_urls:
-        next_urls = select_next_urls_to_jump_to()
-    if i % 100 == 0:
-        tqdm.write(f"Processed {i} iterations")
-
+            # extract urls and queue the urls that have not been visited or queued yet
+            outgoing_links, url_concepts = extract_link_concepts_and_urls(soup_content, next_urls[0])
+            page_outgoing_urls = outgoing_links - visited_urls - queued_urls
+            queued_urls.update(page_outgoing_urls)
+            url_queue.extend(page_outgoing_urls)
+
+            # extract concepts from links and italic words
+            concepts = pd.DataFrame({"concepts": list(url_concepts | get_all_italic_words(soup_content))})
+            concepts["culture"] = default_culture
+            concepts["semantic_field"] = default_semantic_field
+            concepts_with_information = find_paragraphs_for_concepts(soup, concepts)
+            concepts_culture = assign_culture_and_semantic_fields_to_concepts(concepts_with_information)
+
+            output_buffers[CONCEPT_FILE].append(concepts_culture)
+
+        next_urls.popleft()
+        # parse new urls if there are no urls to jumps to
+        if not next_urls:
+            next_urls = select_next_urls_to_jump_to(url_queue, visited_urls)
+            if not next_urls:
+                tqdm.write("No urls left to visit")
+                break
+        if i % FLUSH_INTERVAL == 0:
+            pending_writes += flush_output_buffers(output_buffers, seen_rows, writer)
+            tqdm.write(f"Processed {i} iterations")
+finally:
+    executor.shutdown(cancel_futures=True)
+    pending_writes += flush_output_buffers(output_buffers, seen_rows, writer)
+    writer.shutdown()
+
+    # save the urls that have not been visited for later runs
+    pd.DataFrame({"urls": list(url_queue)}).to_csv(ALL_URLS_FILE, index=False)
+
+    # raise errors of the background writes
+    for write in pending_writes:
+        write.result()
+
+    # the files are only appended to during the crawl, remove duplicates from earlier runs once at the end
+    for filename in seen_rows:
+        remove_duplicates_from_file(filename)
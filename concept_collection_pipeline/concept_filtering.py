@@ -1,9 +1,13 @@
 import os
-import re
-from openai import OpenAI
+import json
+import asyncio
+import hashlib
+import sqlite3
+from openai import AsyncOpenAI, OpenAIError
+import ahocorasick
+import xlsxwriter
 from tqdm import tqdm
 import pandas as pd
-from tqdm import tqdm
 
 ###############filtering loctions and persons#############
 
@@ -22,27 +26,92 @@ def get_data_from_db(file_path: str) -> pd.Series:
     df.dropna()
     return df.iloc[:, 0]
 
-def contains_location(caption: str):
-    if isinstance(caption, float):
+def pad_words(text: str) -> str:
+    """normalizes the whitespace of a text and pads it with spaces, so that whole words can be matched as " word "
+
+    Args:
+        text (str): the text to pad
+
+    Returns:
+        str: the lowercased text with single spaces between words and a space at the beginning and end
+    """
+    return " " + " ".join(text.lower().split()) + " "
+
+def build_automaton(names) -> ahocorasick.Automaton:
+    """builds an Aho-Corasick automaton over the padded names, so that all names occuring in a caption 
+       are found in a single scan of the caption instead of one scan per name
+
+    Args:
+        names (Iterable[str]): names of notable persons or locations
+
+    Returns:
+        ahocorasick.Automaton: automaton matching the padded names
+    """
+    automaton = ahocorasick.Automaton()
+    for name in names:
+        if isinstance(name, str) and name.strip():
+            automaton.add_word(pad_words(name), name)
+    automaton.make_automaton()
+    return automaton
+
+def contains_name_from_automaton(caption: str, automaton: ahocorasick.Automaton) -> bool:
+    """checks whether any name of the automaton appears as whole words in the caption
+
+    Args:
+        caption (str): the caption to search in
+        automaton (ahocorasick.Automaton): automaton built with build_automaton
+
+    Returns:
+        bool: True if at least one name appears in the caption
+    """
+    # an automaton without any names cannot be searched
+    if not isinstance(caption, str) or automaton.kind != ahocorasick.AHOCORASICK:
         return False
-    caption_words = caption.split()
-    for location in LOCATION_DB:
-        if isinstance(location, str):
-            location_words = location.split()
-            if all(word in caption_words for word in location_words):
-                return True
-    return False
+    return next(automaton.iter(pad_words(caption)), None) is not None
+
+def split_into_words(column: pd.Series) -> pd.Series:
+    """lowercases and splits every entry of a column column-wise, so that only whole words are looked up per entry
+
+    Args:
+        column (pd.Series): column of concepts
+
+    Returns:
+        pd.Series: the lists of words, missing concepts stay missing
+    """
+    return column.str.lower().str.split()
+
+def get_name_tokens(names) -> frozenset[str]:
+    """collects the lowercased single words of all names, e.g. the first names and surnames of notable persons
+
+    Args:
+        names (Iterable[str]): names of notable persons
+
+    Returns:
+        frozenset[str]: the words of all names
+    """
+    return frozenset(word for name in names if isinstance(name, str) for word in name.lower().split())
+
+def contains_tokens_in_words(words: pd.Series, tokens: frozenset[str]) -> pd.Series:
+    """checks for every entry whether any of its words is one of the tokens, only the set lookup runs per entry
+
+    Args:
+        words (pd.Series): the words of the concepts built with split_into_words
+        tokens (frozenset[str]): words built with get_name_tokens
+
+    Returns:
+        pd.Series: boolean mask that is True where at least one word is a token
+    """
+    # missing concepts have no words and never contain a name
+    return words.map(lambda concept_words: isinstance(concept_words, list) and not tokens.isdisjoint(concept_words)).astype(bool)
+
+def contains_location(caption: str):
+    return contains_name_from_automaton(caption, LOCATION_AUTOMATON)
 
 def contains_person_name(caption: str):
-    if isinstance(caption, float):
+    if not isinstance(caption, str):
         return False
-    caption_words = caption.split()
-    for name in PERSON_DB:
-        name_words = name.split()
-        for subname in name_words:
-            if subname in caption_words:
-                return True
-    return False
+    # a single part of a name, e.g. the surname, is enough to count as a person
+    return not PERSON_TOKENS.isdisjoint(caption.lower().split())
 
 def remove_people_and_locations_from_concepts(concepts: pd.DataFrame) -> pd.DataFrame:
     """takes in a file and removes all persons and locations from the column "concepts"
@@ -55,16 +124,57 @@ def remove_people_and_locations_from_concepts(concepts: pd.DataFrame) -> pd.Data
         pd.DataFrame: filtered concepts without notable persons and locations
     """
     
-    condition = concepts['concepts'].apply(lambda concept: not contains_person_name(concept))
+    concept_words = split_into_words(concepts['concepts'])
+    condition = ~contains_tokens_in_words(concept_words, PERSON_TOKENS)
     filtered_df = concepts[condition]
 
     return filtered_df
 
 ##############GPT filtering##############################
 # set OpenAi_key in shell to execute the code underneath
-client = OpenAI(
+# failed requests, e.g. due to rate limits, are retried with exponential backoff by the client
+client = AsyncOpenAI(
     api_key = os.getenv("OPENAI_API_KEY"),
+    max_retries = 5,
 )
+# model answering the GPT prompt, it has to support structured outputs
+GPT_MODEL = "gpt-4o-mini"
+# maximum number of requests sent to the api at the same time
+GPT_CONCURRENCY = 100
+# maximum number of requests the batch api accepts per batch
+BATCH_API_MAX_REQUESTS = 50000
+# seconds to wait between checking whether a batch has finished
+BATCH_POLL_INTERVAL = 60
+# number of concepts asked for in a single request
+GPT_GROUP_SIZE = 20
+# the answers the model can choose from
+COUNTRIES = ["China", "Germany", "Spain", "South Korea", "None"]
+CATEGORIES = ["Beverages", "Celebration", "Clothing", "Food", "Fruit", "Houses", "Music", "Religion", "Sport", "Utensil", "Vegetable", "Visual Arts", "None"]
+LANGUAGES = ["Chinese", "English", "German", "Korean", "Spanish", "None"]
+# json schema the model has to answer in, with one answer per concept of a group
+ANSWER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answers": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "concept": {"type": "string"},
+                    "country": {"type": "string", "enum": COUNTRIES},
+                    "category": {"type": "string", "enum": CATEGORIES},
+                    "language": {"type": "string", "enum": LANGUAGES},
+                },
+                "required": ["concept", "country", "category", "language"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["answers"],
+    "additionalProperties": False,
+}
+# answers of earlier runs, so that re-running the pipeline only asks for new concepts
+RESPONSE_CACHE_FILE = "output/cache.db"
 
 def create_empty_csv(filepath: str):
     columns = ["concept", "country", "semantic_field", "language"]
@@ -76,21 +186,301 @@ def create_empty_csv(filepath: str):
         # Save the DataFrame to a CSV file
         df.to_csv(filepath, index=False)
 
-def get_single_response(concept):
-    message = "You are a Cultural Expert who knows all the answers to culturally specific questions. Answer the following questions.\
-    Question: What country is the following concept from? Choose from the countries:  China, Germany, Spain, South Korea, None.\
-    Which category does the concept belong to? Choose the category from the concepts: Beverages, Celebration, Clothing, Food, Fruit, Houses, Music, Religion, Sport, Utensil, Vegetable, Visual Arts, Food, None. \
-    In which language is the concept written? Choose the language from Chinese, English, German, Korean, Spanish, None.\
-    Provide the answer in the form: {Concept: Horchata, Country: Spain, Category: Beverages, Language: Spanish}.\
-    Concept: " + concept+ "Your Answer:\
-    When providing the answer, answer in the requested format."
-
-    completion = client.chat.completions.create(model = "gpt-3.5-turbo",
-                                                messages=[{"role": "user", "content": message}], temperature=0.5, max_tokens=600)
-    
-    return completion.choices[0].message.content
+def split_into_groups(concepts: list[str]) -> list[list[str]]:
+    return [concepts[start:start + GPT_GROUP_SIZE] for start in range(0, len(concepts), GPT_GROUP_SIZE)]
+
+def build_request_body(concepts: list[str]) -> dict:
+    """builds the chat completion request asking for the country, category and language of a group of concepts
+
+    Args:
+        concepts (list[str]): the concepts to ask about
+
+    Returns:
+        dict: the parameters of the chat completion request
+    """
+    numbered_concepts = "\n".join(f"{number}. {concept}" for number, concept in enumerate(concepts, start=1))
+    message = "You are a Cultural Expert who knows all the answers to culturally specific questions. Answer the following questions for each of the concepts below.\
+    Question: What country is the concept from? Choose from the countries: " + ", ".join(COUNTRIES) + ".\
+    Which category does the concept belong to? Choose the category from the concepts: " + ", ".join(CATEGORIES) + ". \
+    In which language is the concept written? Choose the language from " + ", ".join(LANGUAGES) + ".\
+    Provide one answer per concept, in the order of the concepts.\
+    Concepts:\n" + numbered_concepts + "\nYour Answers:"
+
+    # the answers are returned as json following ANSWER_SCHEMA, a single answer takes less than 80 tokens
+    response_format = {"type": "json_schema", "json_schema": {"name": "concept_answers", "schema": ANSWER_SCHEMA, "strict": True}}
+    return {"model": GPT_MODEL, "messages": [{"role": "user", "content": message}], "temperature": 0.5, "max_tokens": 80 * len(concepts), "response_format": response_format}
+
+def normalize_concept(concept: str) -> str:
+    return " ".join(concept.casefold().split())
+
+def parse_group_answer(answer: str | None, concepts: list[str]) -> list[dict | None] | None:
+    """parses the json answer for a group of concepts into the answers of the single concepts
 
-def evaluate_concepts_GPT(concepts: pd.DataFrame, gold: str, candidates:str, drop:str, unassigned: str):
+    Args:
+        answer (str | None): the model answer for the group
+        concepts (list[str]): the concepts of the group
+
+    Returns:
+        list[dict | None] | None: the answers in the order of the concepts, or None if the answers do not match the concepts one by one.
+        A single concept without a valid answer gets None as its answer instead
+    """
+    try:
+        answers = json.loads(answer)["answers"]
+    except (TypeError, ValueError, KeyError):
+        # answers cut off at max_tokens or refused by the model are no valid json
+        answers = None
+
+    if answers is None or len(answers) != len(concepts):
+        return [None] if len(concepts) == 1 else None
+    # a skipped and a repeated answer keep the length of a group, so every answer has to name its concept
+    if len(concepts) > 1 and any(normalize_concept(answer["concept"]) != normalize_concept(concept) for answer, concept in zip(answers, concepts)):
+        return None
+    return answers
+
+async def get_group_response(concepts: list[str], semaphore: asyncio.Semaphore) -> list[dict | None]:
+    """asks for a group of concepts in a single request. If the answer cannot be matched to the concepts, every concept is asked for on its own
+
+    Args:
+        concepts (list[str]): the concepts of the group
+        semaphore (asyncio.Semaphore): limits the number of requests sent at the same time
+
+    Returns:
+        list[dict | None]: the answers in the order of the concepts
+    """
+    async with semaphore:
+        completion = await client.chat.completions.create(**build_request_body(concepts))
+
+    answers = parse_group_answer(completion.choices[0].message.content, concepts)
+    if answers is None:
+        answers = await get_single_responses(concepts, semaphore)
+    return answers
+
+async def get_single_responses(concepts: list[str], semaphore: asyncio.Semaphore) -> list[dict | None]:
+    """sends one request per concept, used when the answer for a group of concepts could not be parsed
+
+    Args:
+        concepts (list[str]): the concepts to get an answer for
+        semaphore (asyncio.Semaphore): limits the number of requests sent at the same time
+
+    Returns:
+        list[dict | None]: the answers in the order of the concepts, or None if a request failed despite retrying
+    """
+    results = await asyncio.gather(*[get_group_response([concept], semaphore) for concept in concepts], return_exceptions=True)
+    return [None if isinstance(result, BaseException) else result[0] for result in results]
+
+async def cache_group_answers(concepts: list[str], coroutine, connection: sqlite3.Connection) -> list[dict | None]:
+    # saves the answers of a group as soon as they arrive, so an interrupted run keeps them
+    answers = await coroutine
+    cache_responses(connection, concepts, answers)
+    return answers
+
+async def track_progress(coroutine, progress: tqdm):
+    # counts the coroutine as done on the progress bar, also if it raised
+    try:
+        return await coroutine
+    finally:
+        progress.update()
+
+async def get_all_responses(concepts: list[str], connection: sqlite3.Connection) -> list[dict | None]:
+    """sends the GPT prompt for groups of GPT_GROUP_SIZE concepts concurrently, with at most GPT_CONCURRENCY requests at the same time
+
+    Args:
+        concepts (list[str]): the concepts to get an answer for
+        connection (sqlite3.Connection): the cache the answers of each group are saved in
+
+    Returns:
+        list[dict | None]: the answers in the order of the concepts, or None if a request failed despite retrying
+    """
+    semaphore = asyncio.Semaphore(GPT_CONCURRENCY)
+    groups = split_into_groups(concepts)
+    with tqdm(total=len(groups)) as progress:
+        results = await asyncio.gather(*[track_progress(cache_group_answers(group, get_group_response(group, semaphore), connection), progress) for group in groups], return_exceptions=True)
+
+    answers = []
+    for group, result in zip(groups, results):
+        answers.extend([None] * len(group) if isinstance(result, BaseException) else result)
+    return answers
+
+async def submit_batch(groups: list[list[str]], first_index: int, batch_file: str) -> str:
+    """writes one request per group of concepts into a jsonl file, uploads it and starts a job on the batch api
+
+    Args:
+        groups (list[list[str]]): the groups of concepts of the batch
+        first_index (int): index of the first group of the batch among all groups, used as the id of its request
+        batch_file (str): the jsonl file to write the requests to
+
+    Returns:
+        str: id of the started batch
+    """
+    with open(batch_file, "w", encoding="utf-8") as file:
+        for index, group in enumerate(groups, start=first_index):
+            request = {"custom_id": str(index), "method": "POST", "url": "/v1/chat/completions", "body": build_request_body(group)}
+            file.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+    with open(batch_file, "rb") as file:
+        batch_input = await client.files.create(file=file, purpose="batch")
+    try:
+        batch = await client.batches.create(input_file_id=batch_input.id, endpoint="/v1/chat/completions", completion_window="24h")
+    except BaseException:
+        # collect_batch_answers deletes the input file of a started batch, without a batch nothing else would
+        await delete_batch_files(batch_input.id)
+        raise
+    return batch.id
+
+async def delete_batch_files(*file_ids: str | None):
+    # the files of the batch api stay in the account until they are deleted
+    for file_id in file_ids:
+        if not file_id:
+            continue
+        try:
+            await client.files.delete(file_id)
+        except OpenAIError as error:
+            tqdm.write(f"Could not delete file {file_id}: {error}")
+
+async def collect_batch_answers(batch_id: str) -> dict[int, str]:
+    """waits until a batch has finished and downloads the answers of its successful requests, afterwards the files of the batch are deleted
+
+    Args:
+        batch_id (str): id of the batch
+
+    Returns:
+        dict[int, str]: the answers keyed by the index of their group
+    """
+    batch = await client.batches.retrieve(batch_id)
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(BATCH_POLL_INTERVAL)
+        batch = await client.batches.retrieve(batch_id)
+
+    answers = {}
+    try:
+        # expired and cancelled batches still provide the answers of their finished requests
+        if batch.output_file_id:
+            output = await client.files.content(batch.output_file_id)
+            for line in output.text.splitlines():
+                result = json.loads(line)
+                if result["response"] and result["response"]["status_code"] == 200:
+                    answers[int(result["custom_id"])] = result["response"]["body"]["choices"][0]["message"]["content"]
+    finally:
+        await delete_batch_files(batch.input_file_id, batch.output_file_id, batch.error_file_id)
+    return answers
+
+async def get_batch_responses(concepts: list[str], batch_file_prefix: str, connection: sqlite3.Connection) -> list[dict | None]:
+    """gets the answers for all concepts from the batch api, which is cheaper than single requests but may take up to 24 hours.
+    Groups without an answer, e.g. of a failed or expired batch, are sent again as a group with a single request.
+    Only groups whose answer cannot be parsed are asked for again with one request per concept
+
+    Args:
+        concepts (list[str]): the concepts to get an answer for
+        batch_file_prefix (str): path prefix of the jsonl files holding the requests of each batch
+        connection (sqlite3.Connection): the cache the answers of each batch and retried group are saved in
+
+    Returns:
+        list[dict | None]: the answers in the order of the concepts, or None if the request of a concept failed
+    """
+    groups = split_into_groups(concepts)
+    batch_ids = []
+    for start in range(0, len(groups), BATCH_API_MAX_REQUESTS):
+        batch_groups = groups[start:start + BATCH_API_MAX_REQUESTS]
+        batch_ids.append(await submit_batch(batch_groups, start, f"{batch_file_prefix}_{start}.jsonl"))
+
+    semaphore = asyncio.Semaphore(GPT_CONCURRENCY)
+    answers = []
+    retries = []
+    for start, batch_id in zip(range(0, len(groups), BATCH_API_MAX_REQUESTS), batch_ids):
+        group_answers = await collect_batch_answers(batch_id)
+        batch_concepts, batch_answers = [], []
+        for index, group in enumerate(groups[start:start + BATCH_API_MAX_REQUESTS], start=start):
+            group_answer = group_answers.get(index)
+            if group_answer is None:
+                # get_group_response itself falls back to single concepts if the new answer cannot be parsed
+                retries.append((len(answers), group, cache_group_answers(group, get_group_response(group, semaphore), connection)))
+                split_answers = [None] * len(group)
+            else:
+                split_answers = parse_group_answer(group_answer, group)
+                if split_answers is None:
+                    retries.append((len(answers), group, cache_group_answers(group, get_single_responses(group, semaphore), connection)))
+                    split_answers = [None] * len(group)
+                else:
+                    batch_concepts.extend(group)
+                    batch_answers.extend(split_answers)
+            answers.extend(split_answers)
+        # the answers of a finished batch are saved before waiting for the next one
+        cache_responses(connection, batch_concepts, batch_answers)
+
+    retried_answers = await asyncio.gather(*[retry for _, _, retry in retries], return_exceptions=True)
+    for (start, group, _), retried in zip(retries, retried_answers):
+        # groups whose request failed again despite retrying stay without answers
+        answers[start:start + len(group)] = [None] * len(group) if isinstance(retried, BaseException) else retried
+    return answers
+
+def get_prompt_hash() -> str:
+    # the request without concepts holds the model, the prompt template, the answer options and ANSWER_SCHEMA
+    prompt = json.dumps(build_request_body([]), ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(prompt.encode("utf-8")).hexdigest()
+
+def get_cache_key(prompt_hash: str, concept: str) -> str:
+    return hashlib.blake2b((prompt_hash + concept).encode("utf-8")).hexdigest()
+
+def open_response_cache(cache_file: str) -> sqlite3.Connection:
+    """opens the sqlite database caching the model answers and creates its table if needed
+
+    Args:
+        cache_file (str): location of the database
+
+    Returns:
+        sqlite3.Connection: connection to the database
+    """
+    connection = sqlite3.connect(cache_file)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, answer TEXT)")
+    return connection
+
+def get_cached_responses(connection: sqlite3.Connection, concepts: list[str]) -> dict[str, dict]:
+    """looks up the answers of earlier runs for the concepts, answers that cannot be decoded are dropped from the cache
+
+    Args:
+        connection (sqlite3.Connection): connection to the cache
+        concepts (list[str]): the concepts to look up
+
+    Returns:
+        dict[str, dict]: the cached answers keyed by their concept, concepts without an answer are left out
+    """
+    prompt_hash = get_prompt_hash()
+    cached_answers = {}
+    broken_keys = []
+    for concept in concepts:
+        key = get_cache_key(prompt_hash, concept)
+        row = connection.execute("SELECT answer FROM responses WHERE key = ?", (key,)).fetchone()
+        if not row:
+            continue
+        try:
+            answer = json.loads(row[0])
+        except ValueError:
+            answer = None
+        if isinstance(answer, dict) and all(field in answer for field in ("country", "category", "language")):
+            cached_answers[concept] = answer
+        else:
+            broken_keys.append((key,))
+    # broken answers are dropped, so the concepts are asked for again and their new answers can be saved
+    if broken_keys:
+        with connection:
+            connection.executemany("DELETE FROM responses WHERE key = ?", broken_keys)
+    return cached_answers
+
+def cache_responses(connection: sqlite3.Connection, concepts: list[str], answers: list[dict | None]):
+    """saves the answers in the cache, failed requests are not saved so they are asked for again in the next run
+
+    Args:
+        connection (sqlite3.Connection): connection to the cache
+        concepts (list[str]): the concepts that were asked for
+        answers (list[dict | None]): the answers in the order of the concepts
+    """
+    prompt_hash = get_prompt_hash()
+    rows = [(get_cache_key(prompt_hash, concept), json.dumps(answer, ensure_ascii=False)) for concept, answer in zip(concepts, answers) if answer is not None]
+    with connection:
+        connection.executemany("INSERT OR IGNORE INTO responses (key, answer) VALUES (?, ?)", rows)
+
+def evaluate_concepts_GPT(concepts: pd.DataFrame, gold: str, candidates:str, drop:str, unassigned: str, batch_file_prefix: str | None = None):
     """evaluates the concepts and assigns them into 4 different dataframes depending on how well they match our chosen cultures and semantic fields 
 
     Args:
@@ -98,7 +488,8 @@ def evaluate_concepts_GPT(concepts: pd.DataFrame, gold: str, candidates:str, dro
         gold (str): the concepts that have no none in their answer generation
         candidates (str): concepts for which none appears at least one but less than three times
         drop (str): dropped concepts for which multiple categories are none
-        unassigned (str): concepts that do not match our expression matching 
+        unassigned (str): concepts for which the model gave no valid answer
+        batch_file_prefix (str | None, optional): if given, the batch api is used and its requests are written to files with this prefix. Defaults to None.
     """
 
     create_empty_csv(drop)
@@ -110,45 +501,79 @@ def evaluate_concepts_GPT(concepts: pd.DataFrame, gold: str, candidates:str, dro
             pass  
     
     # apply the GPT prompt to every concept candidate
-    for concept in tqdm(concepts.iloc[:, 0]):
-        answer = get_single_response(concept)
-        # captures the relevant answer components of the model answer i.e. Country:Germany, Category:Beverages 
-        pattern = r':\s(.*?)(?=,|$)'
-        matches = re.findall(pattern, answer)
-        # answers with too little information are saved in a seperate file
-        if len(matches) < 4:
-            with open(unassigned, 'a') as file:
-                file.write(concept + ", ".join(matches) + "\n")
+    concept_list = concepts.iloc[:, 0].tolist()
+    cache = open_response_cache(RESPONSE_CACHE_FILE)
+    answers = get_cached_responses(cache, concept_list)
+    new_concepts = list(dict.fromkeys(concept for concept in concept_list if concept not in answers))
+    # the answers are saved in the cache while they arrive
+    try:
+        if not new_concepts:
+            new_answers = []
+        elif batch_file_prefix:
+            new_answers = asyncio.run(get_batch_responses(new_concepts, batch_file_prefix, cache))
+        else:
+            new_answers = asyncio.run(get_all_responses(new_concepts, cache))
+    finally:
+        cache.close()
+    answers.update(zip(new_concepts, new_answers))
+
+    # collect the rows of every file and write each file once at the end
+    gold_rows, drop_rows, candidate_rows, unassigned_lines = [], [], [], []
+    for concept in concept_list:
+        answer = answers[concept]
+        # requests that failed despite retrying or were not answered in the json schema are saved in a seperate file
+        if answer is None:
+            unassigned_lines.append(concept + "\n")
             continue
     
-        new_row = pd.DataFrame([{
+        new_row = {
             "concept": concept,
-            "country": matches[1],
-            "semantic_field": matches[2],
-            "language": matches[3]
-        }])
+            "country": answer["country"],
+            "semantic_field": answer["category"],
+            "language": answer["language"]
+        }
 
     	# sort the concept candidates in our three categories, depending on how often none appears in the model response
-        lowercase_list = [element.lower() for element in matches]
+        lowercase_list = [new_row[column].lower() for column in ("country", "semantic_field", "language")]
         count = lowercase_list.count("none")
         if count == 0:
-            new_row.to_csv(gold, mode='a', header=not pd.io.common.file_exists(gold), index=False)
+            gold_rows.append(new_row)
         elif count == 3:
-            new_row.to_csv(drop, mode='a', header=not pd.io.common.file_exists(drop), index=False)
+            drop_rows.append(new_row)
         else:
-            new_row.to_csv(candidates, mode='a', header=not pd.io.common.file_exists(candidates), index=False)
+            candidate_rows.append(new_row)
+
+    with open(unassigned, 'a') as file:
+        file.writelines(unassigned_lines)
+    # the files already have their header from create_empty_csv
+    for file_path, rows in ((gold, gold_rows), (drop, drop_rows), (candidates, candidate_rows)):
+        pd.DataFrame(rows, columns=["concept", "country", "semantic_field", "language"]).to_csv(file_path, mode='a', header=False, index=False)
 
 def cleanup_format(old_file: str, new_file:str):
 
-    # remove {} brackets at the beginning or end of the row of the concept candidates
-    with open(old_file, mode="r", encoding="utf-8") as f:
-        with open(new_file, 'a', encoding="utf-8") as file:
-            for line in f.readlines():
-                line = line.lower()
-                if line[0] == "{":
-                    file.write(line[10:-2] + "\n")
-                else:
-                    file.write(line[:-2] + "\n")
+    # remove {} brackets at the beginning or end of the row of the concept candidates, 
+    # answers given in the json schema have none and are only lowercased
+    # the lines are streamed through 1 MiB buffers instead of reading the whole file into memory
+    with open(old_file, mode="r", encoding="utf-8", buffering=1 << 20) as f:
+        with open(new_file, 'a', encoding="utf-8", buffering=1 << 20) as file:
+            lines = (line.lower().rstrip("\n").removeprefix("{concept: ").removesuffix("}") for line in f)
+            file.writelines(line + "\n" for line in lines)
+
+def lowercase_cells(df: pd.DataFrame) -> pd.DataFrame:
+    """lowercases the strings of a dataframe column-wise and converts all other values, including missing ones, to strings
+
+    Args:
+        df (pd.DataFrame): the dataframe to lowercase
+
+    Returns:
+        pd.DataFrame: copy of the dataframe containing only strings
+    """
+    df = df.copy()
+    object_columns = df.select_dtypes(include="object").columns
+    other_columns = df.columns.difference(object_columns)
+    df[object_columns] = df[object_columns].apply(lambda column: column.str.lower().fillna(column.astype(str)))
+    df[other_columns] = df[other_columns].astype(str)
+    return df
 
 def sort_csv(file_name: str):
     df = pd.read_csv(file_name)
@@ -157,7 +582,7 @@ def sort_csv(file_name: str):
     df = df.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
 
     # lowercase all names
-    df = df.applymap(lambda x: x.lower() if isinstance(x, str) else str(x))
+    df = lowercase_cells(df)
 
     # Sort the DataFrame first by the second column, then by the third column
     sorted_df = df.sort_values(by=[df.columns[1], df.columns[2], df.columns[0]])
@@ -171,42 +596,16 @@ def seperate_incorrect_gpt_assignments(concepts: pd.DataFrame):
     Args:
         concepts (pd.DataFrame): the concepts to further seperate
     """
-    gold_concepts = []
-    general_concepts = []
     cultures = ["germany", "south korea", "china", "spain"]
     semantic_fields = ["beverages", "celebration", "food", "clothing", "fruit", "houses", "music", "religion", "sport", "utensil", "vegetable", "visual arts"]
+    languages = ["german", "korean", "chinese", "spanish", "english"]
     
-    concepts = concepts.applymap(lambda x: x.lower() if isinstance(x, str) else str(x))
+    concepts = lowercase_cells(concepts)
 
     # ensure to only include concepts that are in the language of one our target cultures or in english
-    for index, row in concepts.iterrows():
-
-        if row["country"] in cultures and row["semantic_field"] in semantic_fields:
-            if row["language"] in "german":
-                row["language"] = "german"
-                gold_concepts.append(row.to_dict())
-
-            elif row["language"] in "korean":
-                row["language"] = "korean"
-                gold_concepts.append(row.to_dict())
-
-            elif row["language"] in "chinese":
-                row["language"] = "chinese"
-                gold_concepts.append(row.to_dict())
-
-            elif row["language"] in "spanish":
-                row["language"] = "spanish"
-                gold_concepts.append(row.to_dict())
-            elif row["language"] in "english":
-                row["language"] = "english"
-                gold_concepts.append(row.to_dict())
-            else: 
-                general_concepts.append(row.to_dict())
-        else:
-            general_concepts.append(row.to_dict())
-
-    gold = pd.DataFrame(gold_concepts, columns=concepts.columns)
-    general = pd.DataFrame(general_concepts, columns=concepts.columns)
+    is_gold = concepts["country"].isin(cultures) & concepts["semantic_field"].isin(semantic_fields) & concepts["language"].isin(languages)
+    gold = concepts[is_gold]
+    general = concepts[~is_gold]
     gold.to_csv("output/gold_candidates.csv", encoding='utf-8', index=False)
     general.to_csv("output/general.csv", encoding='utf-8', index=False)
 
@@ -217,22 +616,15 @@ def seperate_preassigned_concepts(concepts: pd.DataFrame):
         concepts (pd.DataFrame): the concepts to seperate
     """
     # perform an additional assessment to only include concept candidates that do have a culture and semantic field assignment 
-    double_preassigned_concepts = []
-    single_preassigned_concepts = []
-    noisy_concepts = []
-    for index, row in concepts.iterrows():
-        if pd.notna(row.iloc[1]) and row.iloc[1].strip() == "indian":
-            continue
-        elif pd.notna(row.iloc[1]) and row.iloc[1].strip() != "" and pd.notna(row.iloc[2]) and row.iloc[2].strip() != "":
-            double_preassigned_concepts.append(row.to_dict())
-        elif pd.notna(row.iloc[1]) and row.iloc[1].strip() != "" or pd.notna(row.iloc[2]) and row.iloc[2].strip() != "":
-            single_preassigned_concepts.append(row.to_dict())
-        else:
-            noisy_concepts.append(row.to_dict())
-
-    single_assign_concepts = pd.DataFrame(single_preassigned_concepts, columns=concepts.columns)
-    gold_eval_concepts = pd.DataFrame(double_preassigned_concepts, columns=concepts.columns)
-    noisy_df = pd.DataFrame(noisy_concepts, columns=concepts.columns)
+    culture = concepts.iloc[:, 1].fillna("").astype(str).str.strip()
+    semantic_field = concepts.iloc[:, 2].fillna("").astype(str).str.strip()
+    has_culture = culture.ne("")
+    has_semantic_field = semantic_field.ne("")
+    not_indian = culture.ne("indian")
+
+    gold_eval_concepts = concepts[not_indian & has_culture & has_semantic_field]
+    single_assign_concepts = concepts[not_indian & (has_culture ^ has_semantic_field)]
+    noisy_df = concepts[~has_culture & ~has_semantic_field]
     single_assign_concepts.to_csv("output/candidates.csv", encoding='utf-8', index=False)
     gold_eval_concepts.to_csv("output/gold_eval.csv", encoding='utf-8', index=False)
     noisy_df.to_csv("output/noisy_concepts.csv",  encoding='utf-8', index=False)
@@ -241,23 +633,33 @@ def convert_to_xlsx(input_file: str, output_file:str):
 
     df = pd.read_csv(input_file)
     df_sorted = df.sort_values(by=['country', 'semantic_field', 'language'])
-    df_sorted.to_excel(output_file, index=False)
+    # constant_memory writes every row to the file right away instead of keeping the whole workbook in memory.
+    # It only accepts cells row by row, while pandas writes them column by column, so the rows are written directly
+    workbook = xlsxwriter.Workbook(output_file, {"constant_memory": True})
+    worksheet = workbook.add_worksheet()
+    worksheet.write_row(0, 0, df_sorted.columns, workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"}))
+    # missing values are left empty
+    rows = df_sorted.astype(object).where(df_sorted.notna(), None)
+    for row_number, row in enumerate(rows.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(row_number, 0, row)
+    workbook.close()
 
 LOCATION_DB = get_data_from_db("data/GeoNames_DB.csv")
 PERSON_DB = get_data_from_db("data/name_db.csv")
+LOCATION_AUTOMATON = build_automaton(LOCATION_DB)
+PERSON_TOKENS = get_name_tokens(PERSON_DB)
 CONCEPT_FILE = "output/concept_candidates.csv"
 
 # remove duplicate concepts
 df_concepts = pd.read_csv(CONCEPT_FILE)
-duplicates = df_concepts["concepts"].duplicated()
-df_cleaned = df_concepts[~duplicates]
+df_cleaned = df_concepts.drop_duplicates(subset="concepts", keep="first", ignore_index=True)
 
 # filter out persons and locations 
 filtered_concepts = remove_people_and_locations_from_concepts(df_cleaned)
 filtered_concepts.to_csv("output/concepts_filtered.csv", index=False)
 
 # gpt evalution
-evaluate_concepts_GPT(filtered_concepts, "output/gpt_gold_candidates.csv", "output/gpt_concept_candidates.csv", "output/gpt_dropped_concepts.csv", "output/gpt_unassigned_concepts.csv")
+evaluate_concepts_GPT(filtered_concepts, "output/gpt_gold_candidates.csv", "output/gpt_concept_candidates.csv", "output/gpt_dropped_concepts.csv", "output/gpt_unassigned_concepts.csv", batch_file_prefix="output/gpt_batch_requests")
 df = pd.read_csv("output/gpt_gold_candidates.csv")
 seperate_preassigned_concepts(df)
 cleanup_format("output/gold_eval.csv", "output/cleaned_gold_eval.csv")
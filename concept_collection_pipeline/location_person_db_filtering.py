@@ -1,17 +1,22 @@
 import pandas as pd 
-import numpy as np
 
+# the databases are read into pyarrow backed columns, which store millions of strings far more compactly than python objects
 # used for extracting names from the notable persons database 
-name_df = pd.read_csv('data/cross-verified-database.csv', encoding="utf-8", sep=",", encoding_errors="replace")
-name_db = name_df["name"].apply(lambda x: x.lower().replace("_", " ") if isinstance(x, str) else x)
+name_df = pd.read_csv('data/cross-verified-database.csv', encoding="utf-8", sep=",", encoding_errors="replace", dtype_backend="pyarrow")
+# lowercase with python like the concepts, arrow lowercases e.g. "İ" and a final "Σ" differently
+name_db = name_df["name"].dropna().astype(object).str.lower().str.replace("_", " ", regex=False)
 name_db.to_csv("data/name_db.csv", index=False)
 
 # used for loading location databases from the notable persons database 
-GeoNames_DB = pd.read_csv('data/allCountries.txt', sep="\t", low_memory=False).iloc[:,1].drop_duplicates()
-df2 = pd.read_csv('data/worldcities.csv', low_memory=False)
+# the GeoNames dump has no header and only its second column, the name, is parsed.
+# Names like "Nan" or "None" are real places, so nothing is read as missing
+geonames_names = pd.read_csv('data/allCountries.txt', sep="\t", header=None, usecols=[1], names=["name"], na_filter=False, dtype_backend="pyarrow")["name"]
+world_cities = pd.read_csv('data/worldcities.csv', usecols=["city_ascii"], na_filter=False, dtype_backend="pyarrow")["city_ascii"]
 
-# Concatenate the locations from both datasets, clean the data and save the file
-GeoNames_DB = pd.concat([GeoNames_DB.iloc[:, 1], df2.iloc[:, 1]]).drop_duplicates()
-GeoNames_DB = GeoNames_DB.apply(lambda x: str(x).lower() if pd.notna(x) and str(x).replace(' ', '').isalpha() else np.nan)
-GeoNames_DB = GeoNames_DB.dropna()
+# Concatenate the locations from both datasets and drop their duplicates in one pass, clean the data and save the file
+GeoNames_DB = pd.concat([geonames_names, world_cities], ignore_index=True).drop_duplicates()
+# only keep names made of letters and spaces
+is_name = GeoNames_DB.str.replace(" ", "", regex=False).str.isalpha().astype("boolean").fillna(False)
+# lowercase with python like the concepts, arrow lowercases e.g. "İ" and a final "Σ" differently
+GeoNames_DB = GeoNames_DB[is_name].astype(object).str.lower()
 GeoNames_DB.to_csv("data/GeoNames_DB.csv", index=False)
\ No newline at end of file